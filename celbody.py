@@ -1,31 +1,56 @@
-import math
-
-from direct.showbase.Loader import Loader
-from direct.showbase.ShowBase import ShowBase
 from panda3d.core import NodePath, ModelNode, LineSegs, TextNode
 
 from tools import *
 
 
 class CelBody:
-	def __init__(self, base: ShowBase, name, model_path, init_pos, radius, mass, vec3_velocity: tuple[float, ...], color):
-		self.node = NodePath(ModelNode(name))  # creates a ModelNode and wraps it in a NodePath
-		self.name = name
+	"""
+	Lightweight record of a celestial body
 
-		self.base = base
-		self.loader = Loader(self.base)
+	The physical state lives in the arrays of the owning ``BodyRegistry`` (at row ``index``).
+	Scene graph nodes, name tag and motion trail only exist while the body is visible or selected.
+	"""
 
-		# load the planet model and attach it to the NodePath
-		self.model = self.loader.loadModel(model_path)
-		self.model.reparentTo(self.node)
+	__slots__ = ("registry", "index", "name", "model_path", "radius", "color", "node", "nametag", "nametag_np", "trail")
 
-		self.init_pos = init_pos
-		self.node.setPos(self.init_pos)
+	def __init__(self, registry, index, name, model_path, radius, color):
+		self.registry = registry
+		self.index = index
+		self.name = name
+		self.model_path = model_path
 		self.radius = radius
-		self.node.setScale(self.radius)
-
 		self.color = color
+
+		self.node = None
+		self.nametag = None
+		self.nametag_np = None
+		self.trail = None
+
+	@property
+	def mass(self):
+		return self.registry.mass[self.index]
+
+	@property
+	def vec3_velocity(self):
+		return self.registry.vel[self.index]
+
+	# returns position in panda3d units
+	@property
+	def pos(self):
+		return tuple(m_to_u(self.registry.pos_m[self.index]))
+
+	def create_nodes(self):
+		if self.node is not None:
+			return
+
+		base = self.registry.base
+
+		self.node = NodePath(ModelNode(self.name))  # creates a ModelNode and wraps it in a NodePath
+		self.registry.model(self.model_path).instanceTo(self.node)  # all bodies share the loaded geometry
+		self.node.setPos(*self.pos)
+		self.node.setScale(self.radius)
 		self.node.setColor(self.color)
+		self.node.reparentTo(base.render)
 
 		self.trail = MotionTrail(self, self.color, 1000)
 
@@ -35,40 +60,27 @@ class CelBody:
 		self.nametag.setCardColor(0, 0, 0, 1)
 		self.nametag.setCardAsMargin(0, 0, 0, 0)
 		self.nametag.setCardDecal(True)
-		self.nametag_np: NodePath = base.render.attachNewNode(self.nametag)
-
-		# given physical properties
-		self.mass = mass
-		self.vec3_velocity = list(vec3_velocity)
-
-		self.l_vec3_f_forces = []
-		self.vec3_f_fres = 0
-		self.vec3_f_accel = 0
+		self.nametag_np = base.render.attachNewNode(self.nametag)
+		self.nametag_np.hide()  # shown by the NametagLayer if there is room for it
 
-	# returns distance (center to center) to other celbody
-	def distance(self, celbody):
-		x1, y1, z1 = self.node.getPos()
-		x2, y2, z2 = celbody.node.getPos()
-		return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 + (z2 - z1) ** 2)
-
-	def distance_m(self, celbody):
-		return u_to_m(self.distance(celbody))
+	def release_nodes(self):
+		if self.node is None:
+			return
 
-	# returns vector (in units) from self to celbody
-	def vec3u_r(self, celbody):
-		x1, y1, z1 = self.node.getPos()
-		x2, y2, z2 = celbody.node.getPos()
-		return tuple((x2 - x1, y2 - y1, z2 - z1))
+		self.trail.remove()
+		self.nametag_np.removeNode()
+		self.node.removeNode()
 
-	# returns vector (in meters) from self to celbody
-	def vec3m_r(self, celbody):
-		return vec_mul(self.vec3u_r(celbody), 10**8)
+		self.node = None
+		self.nametag = None
+		self.nametag_np = None
+		self.trail = None
 
 
 class MotionTrail:
 	def __init__(self, parent_celbody: CelBody, color, max_len):
 		self.parent = parent_celbody
-		self.trail_pts = [parent_celbody.init_pos]
+		self.trail_pts = [parent_celbody.node.getPos()]
 		self.trail_color = color
 		self.trail_max_len = max_len  # set to -1 for unlimited
 
@@ -89,10 +101,16 @@ class MotionTrail:
 
 		self.trail_pts.append(pos)  # add current position to motion trail
 
+		self.trail_obj.reset()  # drop the previous segments, they are redrawn below
+		self.trail_obj.setColor(self.trail_color)
 		self.trail_obj.moveTo(self.trail_pts[0])
 		for p in self.trail_pts[1:]:
 			self.trail_obj.drawTo(p)
 
-		new_np = self.parent.base.render.attachNewNode(self.trail_obj.create(True))
+		new_np = self.parent.registry.base.render.attachNewNode(self.trail_obj.create(True))
 		self.trail_obj_np.removeNode()
 		self.trail_obj_np = new_np
+
+	def remove(self):
+		self.trail_obj_np.removeNode()
+		self.trail_pts.clear()
@@ -0,0 +1,272 @@
+import itertools as it
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from panda3d.core import CardMaker, Texture, TransparencyAttrib, Mat4
+from scipy import constants, fft
+
+from physics import field_at
+from tools import m_to_u
+
+# number of point-body terms FieldLayer evaluates between two budget checks
+BLOCK_ELEMENTS = 1 << 14
+
+# anchor colors of the overlay color map, from low to high values
+COLORMAP = np.array([(13, 8, 135), (126, 3, 168), (204, 71, 120), (248, 149, 64), (240, 249, 33)], dtype=np.float64)
+
+
+def grid_points(center, basis, half_width, shape, nodes=None):
+	"""
+	Returns the nodes of a regular grid as (k, 3) array
+
+	:param center: center of the grid in meters
+	:param basis: (3, 3) array, rows are the unit vectors along the grid axes
+	:param half_width: half the edge length of the grid in meters
+	:param shape: number of nodes per axis, 2 entries for a slice spanned by the first two basis vectors, 3 for a volume
+	:param nodes: flat (row-major) indices of the nodes to return, all nodes if None
+	"""
+	axes = [np.linspace(-half_width, half_width, n) for n in shape]
+	if nodes is None:
+		local = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(shape))
+	else:
+		local = np.stack([a[i] for a, i in zip(axes, np.unravel_index(nodes, shape))], axis=-1)
+	return center + local @ basis[:len(shape)]
+
+
+def potential_fft(center, basis, half_width, shape, pos_m, mass, softening=0.0):
+	"""
+	Evaluates the gravitational potential on a regular grid by FFT convolution
+
+	The masses are deposited onto the grid (cloud in cell) and convolved with the (softened) point-mass potential on
+	a zero-padded grid, so there are no periodic images. The cost no longer depends on the number of bodies, which
+	pays off for dense grids. For a 2D slice the bodies are projected onto the slice plane. Bodies outside the grid
+	are added by direct summation.
+
+	:param center: center of the grid in meters
+	:param basis: (3, 3) array, rows are the unit vectors along the grid axes
+	:param half_width: half the edge length of the grid in meters
+	:param shape: number of nodes per axis (2 or 3 entries)
+	:param pos_m: (n, 3) array of body positions in meters
+	:param mass: (n,) array of masses in kg
+	:param softening: Plummer softening length in meters, at least one grid cell is used
+	:return: potential in J/kg, array of ``shape``
+	"""
+	dim = len(shape)
+	cell = 2 * half_width / (np.array(shape) - 1)
+	eps_sq = max(softening, cell.max()) ** 2
+
+	# positions in cell units, (0, 0[, 0]) being the first grid node
+	coords = ((pos_m - center) @ basis[:dim].T + half_width) / cell
+	inside = np.all((coords >= 0) & (coords <= np.array(shape) - 1), axis=1)
+
+	# cloud in cell deposit: every body is split between the 2^dim surrounding nodes
+	grid = np.zeros(shape)
+	base = np.minimum(np.floor(coords[inside]).astype(int), np.array(shape) - 2)
+	frac = coords[inside] - base
+	for corner in it.product((0, 1), repeat=dim):
+		weight = np.prod(np.where(corner, frac, 1 - frac), axis=1) * mass[inside]
+		np.add.at(grid, tuple((base + corner).T), weight)
+
+	# point-mass potential for every node offset of the padded grid
+	padded = tuple(2 * n for n in shape)
+	offsets = [np.minimum(np.arange(p), p - np.arange(p)) * c for p, c in zip(padded, cell)]
+	r_sq = sum(np.meshgrid(*[o ** 2 for o in offsets], indexing='ij'))
+	kernel = -constants.G / np.sqrt(r_sq + eps_sq)
+
+	potential = fft.irfftn(fft.rfftn(grid, padded) * fft.rfftn(kernel), padded)
+	potential = potential[tuple(slice(0, n) for n in shape)]
+
+	if not np.all(inside):
+		points = grid_points(center, basis, half_width, shape)
+		potential += field_at(points, pos_m[~inside], mass[~inside], softening).reshape(shape)
+
+	return potential
+
+
+def colorize(values):
+	"""Maps a 2D array to RGBA bytes (log scale, clipped to the 2nd-98th percentile)"""
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		v = np.log10(np.abs(values))
+	finite = np.isfinite(v)
+	if not finite.any():
+		return np.zeros(values.shape + (4,), dtype=np.uint8)
+
+	lo, hi = np.percentile(v[finite], (2, 98))
+	t = np.clip((np.where(finite, v, hi) - lo) / max(hi - lo, 1e-12), 0, 1) * (len(COLORMAP) - 1)
+	i = np.minimum(t.astype(int), len(COLORMAP) - 2)
+	f = (t - i)[..., None]
+	rgb = COLORMAP[i] * (1 - f) + COLORMAP[i + 1] * f
+
+	rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+	rgba[..., :3] = rgb
+	rgba[..., 3] = 160
+	return rgba
+
+
+class FieldLayer:
+	"""
+	Shows the gravitational potential (or acceleration magnitude) on a slice through the bodies as a textured overlay
+
+	In the inertial frame the slice is the xy plane through the center body. In the co-rotating frame of a
+	primary/secondary pair the slice is their orbital plane, rotating with the pair and centered on their barycenter;
+	the centrifugal potential is added, which makes the Lagrange points visible.
+
+	The field is recomputed in the background from a snapshot of the state: every frame ``update`` works on the next
+	nodes of the grid until ``budget_s`` is used up, the texture is replaced once the whole grid is done. The steps
+	that can't be split up (the FFT and the color mapping) run in a worker thread instead.
+	"""
+
+	def __init__(self, base, registry, resolution=256, quantity="potential", method="direct", budget_s=0.003):
+		self.base = base
+		self.registry = registry
+		self.resolution = resolution
+		self.quantity = quantity  # "potential" or "accel"
+		self.method = method  # "direct" or "fft"
+		self.budget_s = budget_s
+
+		self.center = None  # name of the body in the middle of the slice (inertial frame)
+		self.rotating = None  # (primary, secondary) names for the co-rotating frame, None = inertial frame
+		self.half_width = None  # half the edge length of the slice in meters, None = fit to the bodies
+		self.softening = 0.0
+
+		self.texture = Texture("field")
+		self.texture.setup2dTexture(resolution, resolution, Texture.T_unsigned_byte, Texture.F_rgba8)
+
+		cm = CardMaker("field")
+		cm.setFrame(-1, 1, -1, 1)
+		self.card = base.render.attachNewNode(cm.generate())
+		self.card.setTexture(self.texture)
+		self.card.setTransparency(TransparencyAttrib.M_alpha)
+		self.card.setTwoSided(True)
+		self.card.setLightOff()
+		self.card.setDepthWrite(False)
+		self.card.setBin("fixed", 0)
+		self.card.hide()
+
+		self.shown = False
+		self._refresh = None
+		self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="FieldLayer")
+
+	def show(self, center, rotating=None):
+		self.center = center
+		self.rotating = rotating
+		self.shown = True
+		self._refresh = None  # start over with the new frame
+
+	def hide(self):
+		self.shown = False
+		self._refresh = None
+		self.card.hide()
+
+	def close(self):
+		self.hide()
+		self._worker.shutdown(wait=False, cancel_futures=True)
+
+	def update(self, task):
+		if not self.shown:
+			return task.cont
+
+		deadline = time.perf_counter() + self.budget_s
+		while time.perf_counter() < deadline:
+			if self._refresh is None:
+				self._refresh = self._compute()
+			try:
+				job = next(self._refresh)
+			except StopIteration:
+				self._refresh = None
+				break
+			if job is not None:
+				break  # waiting for the worker thread, look again next frame
+
+		return task.cont
+
+	def _frame(self, pos_m, vel, mass):
+		"""Returns center, basis, half width and angular velocity of the slice"""
+
+		if self.rotating:
+			p, s = (self.registry[name].index for name in self.rotating)
+			vec3_r = pos_m[s] - pos_m[p]
+			h = np.cross(vec3_r, vel[s] - vel[p])
+			r = np.linalg.norm(vec3_r)
+			e1 = vec3_r / r
+			n = h / np.linalg.norm(h)
+			basis = np.array((e1, np.cross(n, e1), n))
+			center = (mass[p] * pos_m[p] + mass[s] * pos_m[s]) / (mass[p] + mass[s])
+			return center, basis, self.half_width or 1.5 * r, np.linalg.norm(h) / r ** 2
+
+		center = pos_m[self.registry[self.center].index]
+		half_width = self.half_width or 1.2 * np.max(np.linalg.norm((pos_m - center)[:, :2], axis=1))
+		return center, np.eye(3), half_width, 0.0
+
+	def _compute(self):
+		"""
+		Generator computing the field for a snapshot of the current state
+
+		Yields None after every block of grid nodes and the pending job while waiting for the worker thread.
+		"""
+
+		n = len(self.registry)
+		pos_m, vel, mass = (a[:n].copy() for a in (self.registry.pos_m, self.registry.vel, self.registry.mass))
+		center, basis, half_width, omega = self._frame(pos_m, vel, mass)
+		shape = (self.resolution, self.resolution)
+
+		if self.method == "fft":
+			job = self._worker.submit(self._fft_field, center, basis, half_width, shape, pos_m, mass, omega,
+									self.softening, self.quantity)
+			while not job.done():
+				yield job
+			values = job.result()
+		else:
+			softening = max(self.softening, half_width / self.resolution)  # nodes may sit right on a body
+			values = np.empty(self.resolution ** 2)
+			size = max(1, BLOCK_ELEMENTS // max(n, 1))  # grid nodes per block
+			for start in range(0, len(values), size):
+				nodes = np.arange(start, min(start + size, len(values)))
+				points = grid_points(center, basis, half_width, shape, nodes)
+				radius_vec = points - center
+				if self.quantity == "accel":
+					a = field_at(points, pos_m, mass, softening, accel=True) + omega ** 2 * radius_vec
+					values[nodes] = np.linalg.norm(a, axis=1)
+				else:
+					values[nodes] = (field_at(points, pos_m, mass, softening)
+									- 0.5 * omega ** 2 * np.einsum('ij,ij->i', radius_vec, radius_vec))
+				yield
+			values = values.reshape(shape)
+
+		job = self._worker.submit(self._texture_image, values)
+		while not job.done():
+			yield job
+
+		self._show_texture(job.result(), center, basis, half_width)
+
+	@classmethod
+	def _fft_field(cls, center, basis, half_width, shape, pos_m, mass, omega, softening, quantity):
+		values = potential_fft(center, basis, half_width, shape, pos_m, mass, softening)
+		values -= 0.5 * omega ** 2 * cls._radius_sq(half_width, shape)  # centrifugal potential
+		if quantity == "accel":
+			cell = 2 * half_width / (shape[0] - 1)
+			values = np.hypot(*np.gradient(values, cell))  # in-plane components only
+		return values
+
+	@staticmethod
+	def _radius_sq(half_width, shape):
+		axes = [np.linspace(-half_width, half_width, n) for n in shape]
+		return sum(np.meshgrid(*[a ** 2 for a in axes], indexing='ij'))
+
+	@staticmethod
+	def _texture_image(values):
+		# grid axis 0 runs along basis[0] (texture u), axis 1 along basis[1] (texture v); image rows are v
+		rgba = colorize(values.T)
+		return np.ascontiguousarray(rgba[..., (2, 1, 0, 3)]).tobytes()  # panda3d keeps textures in BGRA order
+
+	def _show_texture(self, image, center, basis, half_width):
+		self.texture.setRamImage(image)
+
+		# the card is generated in its local xz plane, map x -> basis[0], z -> basis[1] and y -> -normal
+		hw = m_to_u(half_width)
+		e1, e2, n = basis
+		c = m_to_u(center)
+		self.card.setMat(Mat4(*(e1 * hw), 0, *(-n * hw), 0, *(e2 * hw), 0, *c, 1))
+		self.card.show()
@@ -1,10 +1,14 @@
+import argparse
 import datetime
-import itertools as it
 import json
 import platform
+import shlex
 import sys
+import time
 from math import pi, sin, cos
 
+import numpy as np
+
 from direct.gui.DirectEntry import DirectEntry
 from direct.gui.DirectLabel import DirectLabel
 from direct.gui.DirectOptionMenu import DirectOptionMenu
@@ -15,7 +19,14 @@ from panda3d.core import loadPrcFileData, WindowProperties, TextNode, KeyboardBu
 from scipy import constants
 
 from celbody import CelBody
+from field import FieldLayer
 from menu import MenuInstance
+from nametags import NametagLayer
+from orbits import ElementTracker
+import physics
+from registry import BodyRegistry
+from scheduler import FrameScheduler
+from telemetry import TelemetryServer
 from tools import *
 
 running_windows = False
@@ -38,6 +49,23 @@ sync-video 1
 
 loadPrcFileData("", confVars)
 
+parser = argparse.ArgumentParser(description="Orbital Dynamics")
+parser.add_argument("--telemetry-port", type=int, default=None,
+					help="stream the simulation state to local subscribers on this port")
+parser.add_argument("--telemetry-every", type=int, default=1, help="publish a state frame every N simulated frames")
+parser.add_argument("--elements-primary", default=None,
+					help="body the orbital elements are relative to (default: the most massive one)")
+parser.add_argument("--softening", type=float, default=0.0, help="Plummer softening length in meters")
+parser.add_argument("--encounter-eta", type=float, default=0.05,
+					help="regularize a pair once a step spans more than this fraction of its dynamical time (0 = never)")
+parser.add_argument("--field-resolution", type=int, default=256, help="grid size of the gravitational field overlay")
+parser.add_argument("--field-quantity", choices=("potential", "accel"), default="potential")
+parser.add_argument("--field-method", choices=("direct", "fft"), default="direct",
+					help="direct summation or FFT convolution (faster for dense grids)")
+parser.add_argument("--frame-budget-ms", type=float, default=None,
+					help="frame time the simulation adapts to (default: display refresh interval)")
+args, _ = parser.parse_known_args()
+
 
 class MyApp(ShowBase):
 	def __init__(self):
@@ -70,13 +98,13 @@ class MyApp(ShowBase):
 		self.axis.reparentTo(self.render)
 
 		# ----------------- celestial bodies conf -----------------
-		self.celbodies = []  # save all celestial bodies in this list
-
 		# parse celestial bodies from json
 		with open("config.json", "r") as config:
 			# read json file as text and parse it into list/dict
 			self.raw_celbodies = json.loads(config.read())
 
+		self.celbodies = BodyRegistry(self, len(self.raw_celbodies))  # save all celestial bodies in this registry
+
 		seen = set()
 		duplicates = set()  # store duplicates to notify user of duplicate entries
 
@@ -96,14 +124,13 @@ class MyApp(ShowBase):
 			# map values from 0-255 to float between 0 and 1 (required by panda3d)
 			c_rgba = (c_rgb['r'] / 255, c_rgb['g'] / 255, c_rgb['b'] / 255, 1)
 
-			self.celbodies.append(CelBody(self,
-										cb['name'],
-										cb['model_path'],
-										(m_to_u(ip['x']), m_to_u(ip['y']), m_to_u(ip['z'])),
-										m_to_u(r['mantissa'] * 10 ** r['exponent']),
-										m['mantissa'] * 10 ** m['exponent'],
-										(iv['x'], iv['y'], iv['z']),
-										c_rgba))
+			self.celbodies.add(cb['name'],
+							cb['model_path'],
+							(ip['x'], ip['y'], ip['z']),
+							m_to_u(r['mantissa'] * 10 ** r['exponent']),
+							m['mantissa'] * 10 ** m['exponent'],
+							(iv['x'], iv['y'], iv['z']),
+							c_rgba)
 
 		if duplicates:
 			print(f"There {'is' if len(duplicates) == 1 else 'are'} {len(duplicates)} "
@@ -112,11 +139,35 @@ class MyApp(ShowBase):
 				print(f"\t-\t'{d[0]}' @ JSON pos. {d[1]}")
 			print("\nThey will not be added to the simulation\n")
 
-		for cb in self.celbodies:
-			# render all nodes
-			cb.node.reparentTo(self.render)
-
-		self.celbody_pairs = list(it.combinations(self.celbodies, 2))  # save all possible pairs in a list
+		# scene nodes are only created for bodies in view
+		self.celbodies.update_visibility()
+		self.nametags = NametagLayer(self, self.celbodies)
+		print(self.celbodies.memory_report())
+
+		# orbital elements of every body, relative to the most massive one by default
+		self.elements = ElementTracker()
+		self.elements_primary = None
+		if args.elements_primary is not None and args.elements_primary not in self.celbodies:
+			print(f"Unknown body '{args.elements_primary}' for --elements-primary, using the most massive one")
+		self.set_elements_primary(self.default_elements_primary())
+
+		self.softening = args.softening  # Plummer softening length in meters
+		self.encounter_eta = args.encounter_eta  # threshold for regularizing close pairs, see physics.step
+		self.close_pairs = []  # pairs regularized in the last step
+
+		# gravitational field overlay, computed a few rows per frame
+		self.field = FieldLayer(self, self.celbodies, args.field_resolution, args.field_quantity, args.field_method)
+		self.field.softening = self.softening
+
+		# optional state stream for external tools
+		self.telemetry = None
+		if args.telemetry_port is not None:
+			self.telemetry = TelemetryServer(port=args.telemetry_port, every=args.telemetry_every)
+			try:
+				self.telemetry.start()
+			except OSError as e:
+				print(f"Telemetry disabled, could not listen on port {args.telemetry_port}: {e}")
+				self.telemetry = None
 		# ----------------- end celestial bodies conf -----------------
 
 		# disable default camera control
@@ -168,22 +219,38 @@ class MyApp(ShowBase):
 
 		self.accept("f", self.pause_then_exec, [self.trk_selection])
 
+		self.accept("o", self.compute_elements)  # compute orbital elements now
+		self.accept("e", self.export_elements)  # export recorded orbital elements
+		self.accept("b", self.primary_from_tracking)  # elements relative to the tracked body (or back to default)
+		self.accept("m", self.print_memory_report)  # print memory used by the bodies
+		self.accept("g", self.cycle_field_overlay)  # off -> inertial -> co-rotating field overlay
+		self.accept("n", self.enter_body_command)  # show spawn/delete command entry box
+
 		self.vClock = ClockObject(ClockObject.M_non_real_time)  # create virtual timer by which the simulation runs
 		self.vClock_speed = float(60*24*28)  # time factor
 		self.running = False  # opens simulation in paused state
 		self.clock.reset()
 		self.vClock.reset()
 
+		# decides how many physics steps fit into a frame and how often trails and HUD are updated
+		budget_s = args.frame_budget_ms / 1000 if args.frame_budget_ms else 1 / self.framerate
+		self.scheduler = FrameScheduler(budget_s)
+
 		# some debug text
 		self.realtime_elapsed_text = self.genLabelText(f"Realtime elapsed = -- s", 1)
 		self.vtime_elapsed_text = self.genLabelText(f"Virtual time elapsed = ", 2)
+		self.sim_steps_text = self.genLabelText("", 3)
 
 		self.sim_running_text = self.genLabelText("", 4)
 		self.update_sim_text(self.running)
 
+		self.orbit_text = self.genLabelText("", 5)
+
 		self.cam_pos_text = self.genLabelText(f"Cam xyz = (--, --, --)", 6)
 		self.cam_spd_text = self.genLabelText(f"Cam speed = -- units/frame", 7)
 
+		self.encounter_text = self.genLabelText("", 8)
+
 		self.helptext_tip = self.genLabelText(f"Hold [H] to show controls", 9)
 
 		self.helptext_obj = None
@@ -206,6 +273,12 @@ Play/pause simulation - [P]
 Adjust simulation speed - [T]
 
 Follow object - [F]
+Compute orbital elements - [O]
+Export orbital elements - [E]
+Elements relative to followed object - [B]
+Print memory usage - [M]
+Gravitational field overlay - [G]
+Spawn/delete body - [N]
 
 Close menu / Quit - [Esc]"""
 
@@ -214,10 +287,13 @@ Close menu / Quit - [Esc]"""
 
 		# init empty MenuInstances
 		self.sim_speed_entry = MenuInstance(None, False)
+		self.body_cmd_entry = MenuInstance(None, False)
 		self.cam_speed_entry = MenuInstance(None, False)
 
 		self.tracking_selection = MenuInstance(None, False, self, WindowProperties())
+		self.trk_menu_version = None  # registry version the tracking menu items were built from
 		self.tracking = False
+		self.trk_cb = None  # CelBody currently being tracked
 		self.trk_min_distance = None
 		self.trk_init_distance = None
 		self.trk_h = 0
@@ -231,11 +307,17 @@ Close menu / Quit - [Esc]"""
 		# ----- TASKS -----		(run every frame)
 		self.taskMgr.add(self.update_camera_hpr, "CameraHprUpdater")
 		self.taskMgr.add(self.update_camera_xyz, "CameraPosUpdater")
-		self.taskMgr.add(self.update_vclock, "VirtualClockUpdater")
+		self.taskMgr.add(self.start_frame, "FrameStart", sort=-100)
+		self.taskMgr.add(self.finish_frame, "FrameFinish", sort=49)  # right before rendering (igLoop)
 		self.taskMgr.add(self.update_time_counter, "TimeCounterUpdater")
+		self.taskMgr.add(self.update_orbit_text, "OrbitTextUpdater")
 
 		self.taskMgr.add(self.calc_forces, "ForceUpdater")
+		self.taskMgr.add(self.update_elements, "ElementUpdater")
+		self.taskMgr.add(self.update_trails, "TrailUpdater")
 
+		self.taskMgr.add(self.update_scene_nodes, "SceneNodeUpdater")
+		self.taskMgr.add(self.field.update, "FieldUpdater")
 		self.taskMgr.add(self.update_nametags, "NameTagUpdater")
 
 	# ================ END INIT ===================
@@ -251,6 +333,9 @@ Close menu / Quit - [Esc]"""
 		self.taskMgr.add(self.update_camera_xyz, "CameraPosUpdater")
 		self.taskMgr.add(self.update_nametags, "NameTagUpdater")
 		self.tracking = not leave
+		if leave and self.trk_cb is not None:
+			self.celbodies.select(self.trk_cb, False)
+			self.trk_cb = None
 		self.props.setCursorHidden(True)
 		self.win.requestProperties(self.props)
 
@@ -269,12 +354,13 @@ Close menu / Quit - [Esc]"""
 			self.tracking_tooltip.text = txt
 		self.tracking_tooltip.show()
 
-		cb = None
+		cb = self.celbodies[cb_name]
+		self.celbodies.select(cb)  # keeps its scene nodes alive while tracking
 
-		for loop_cb in self.celbodies:
-			if loop_cb.name == cb_name:
-				cb = loop_cb
-				break
+		if self.trk_cb is not None and self.trk_cb is not cb:
+			self.celbodies.select(self.trk_cb, False)
+		self.trk_cb = cb
+		self.elements.request()  # show elements right away instead of waiting for the next scheduled update
 
 		self.trk_init_distance = 5
 		self.trk_min_distance = cb.radius
@@ -337,7 +423,7 @@ Close menu / Quit - [Esc]"""
 			return task.done
 
 		if not self.tracking_selection.menu_obj:
-			self.tracking_selection.menu_obj = DirectOptionMenu(items=[cb.name for cb in self.celbodies],
+			self.tracking_selection.menu_obj = DirectOptionMenu(items=list(self.celbodies.names),
 																scale=0.075,
 																command=self.init_tracking)
 			trk_sel_label = DirectLabel(parent=self.tracking_selection.menu_obj,
@@ -346,6 +432,10 @@ Close menu / Quit - [Esc]"""
 										text_bg=(0, 0, 0, 1),
 										text_scale=1,
 										text_pos=(-5.25, 0))
+		elif self.trk_menu_version != self.celbodies.version:
+			# bodies were spawned or deleted since the menu was built
+			self.tracking_selection.menu_obj['items'] = list(self.celbodies.names)
+		self.trk_menu_version = self.celbodies.version
 
 		self.tracking_selection.menu_obj.show()
 		self.tracking_selection.reg_open()
@@ -358,29 +448,14 @@ Close menu / Quit - [Esc]"""
 	def pause_then_exec(self, fn, *args):
 		if self.running:
 			self.toggle_sim_state()
-			self.update_vclock(Task)
 			self.update_sim_text(self.running)
 
 		self.taskMgr.doMethodLater(0, fn, None, extraArgs=[Task, *args])
 		# self.taskMgr.step()
 
-	# scale and rotate name tags according to camera position
+	# scale and rotate name tags according to camera position, hiding off-screen and overlapping ones
 	def update_nametags(self, task):
-		for cb in self.celbodies:
-			x, y, z = cb.node.getPos()
-			cb.nametag_np.setPos(x, y, z + 1.2 * cb.radius)  # place name tag slightly above CelBody
-
-			x_nt, y_nt, z_nt = cb.nametag_np.getPos()
-			x_cam, y_cam, z_cam = self.camera.getPos()
-			# fancy math to get pitch and heading
-			new_p = math.degrees(math.atan2(z_nt - z_cam, math.sqrt((x_cam - x_nt) ** 2 + (y_cam - y_nt) ** 2)))
-			new_h = math.degrees(math.atan2(y_cam - y_nt, x_cam - x_nt)) + 90
-			cb.nametag_np.setHpr(new_h, new_p, 0)
-
-			# make name tag bigger the further away camera is
-			d = math.sqrt((x_cam - x_nt) ** 2 + (y_cam - y_nt) ** 2 + (z_cam - z_nt) ** 2)
-			cb.nametag_np.setScale(0.1 * d ** (1/1.1))
-
+		self.nametags.update()
 		return task.cont
 
 	# shows controls as long as H is held down
@@ -437,7 +512,7 @@ Close menu / Quit - [Esc]"""
 			return
 
 		self.vClock_speed = new_speed
-		self.update_vclock(Task)
+		self.scheduler.reset()  # the backlog was due at the old speed
 		self.update_sim_text(self.running)
 		self.esc_handler()
 
@@ -461,12 +536,104 @@ Close menu / Quit - [Esc]"""
 		self.sim_speed_entry.is_open = True
 		self.open_menus.append(self.sim_speed_entry)
 
+	def spawn_body(self, name, pos_m, vec3_velocity, mass, radius_m, color=(1, 1, 1, 1),
+					model_path="./custom_models/sphere.gltf"):
+		"""
+		Adds a body to the running simulation
+
+		:param pos_m: position in meters
+		:param vec3_velocity: velocity in m/s
+		:param mass: mass in kg
+		:param radius_m: radius in meters
+		:param color: RGBA color, components between 0 and 1
+		"""
+		# a single non-finite value spreads to every body within one physics step
+		if not (np.all(np.isfinite(pos_m)) and np.all(np.isfinite(vec3_velocity))
+				and np.isfinite(mass) and np.isfinite(radius_m)):
+			raise ValueError("position, velocity, mass and radius have to be finite")
+		if mass <= 0 or radius_m <= 0:
+			raise ValueError("mass and radius have to be positive")
+
+		cb = self.celbodies.add(name, model_path, pos_m, m_to_u(radius_m), mass, vec3_velocity, color)
+		if self.elements_primary is None:
+			self.set_elements_primary(name)
+		self.bodies_changed()
+		return cb
+
+	def delete_body(self, name):
+		"""Removes a body from the running simulation"""
+
+		if self.trk_cb is not None and self.trk_cb.name == name:
+			self.cleanup_tracking(True)
+		if self.field.center == name or (self.field.rotating and name in self.field.rotating):
+			self.field.hide()
+
+		self.celbodies.remove(name)
+
+		if name == self.elements_primary:
+			self.set_elements_primary(self.default_elements_primary())
+		self.bodies_changed()
+
+	def bodies_changed(self):
+		self.close_pairs = []  # row indices may have changed
+		self.elements.state_changed()
+
+	def run_body_command(self, command):
+		"""
+		Runs a command entered in the body command box:
+
+		``spawn <name> <x> <y> <z> <vx> <vy> <vz> <mass_kg> <radius_m> [<r> <g> <b>]`` (meters, m/s, color 0-255)
+
+		``delete <name>``
+		"""
+		try:
+			words = shlex.split(command)
+			if len(words) == 2 and words[0] == "delete":
+				self.delete_body(words[1])
+			elif len(words) in (10, 13) and words[0] == "spawn":
+				values = [float(w) for w in words[2:]]
+				color = tuple(c / 255 for c in values[8:11]) + (1,) if len(values) == 11 else (1, 1, 1, 1)
+				self.spawn_body(words[1], values[0:3], values[3:6], values[6], values[7], color)
+			else:
+				raise ValueError(f"unknown command '{command}'")
+		except (ValueError, KeyError) as e:
+			print(f"Invalid command: {e}", file=sys.stderr)
+			self.esc_handler()
+			self.enter_body_command(command)  # reopens in case of failed attempt
+			return
+
+		self.esc_handler()
+
+	# brings up spawn/delete command entry box
+	def enter_body_command(self, initial_text=""):
+		if self.open_menus:
+			# abort if it's already open
+			return
+
+		self.body_cmd_entry.menu_obj = DirectEntry(initialText=initial_text,
+												scale=0.05,
+												width=30,
+												numLines=1,
+												focus=True,
+												command=self.run_body_command)
+		body_cmd_entry_label = DirectLabel(parent=self.body_cmd_entry.menu_obj,
+										text='spawn <name> <x> <y> <z> <vx> <vy> <vz> <mass> <radius> [<r> <g> <b>]'
+											' | delete <name>',
+										text_fg=(1, 1, 1, 1),
+										text_bg=(0, 0, 0, 1),
+										text_align=TextNode.ALeft,
+										text_pos=(0, 2))
+
+		self.body_cmd_entry.is_open = True
+		self.open_menus.append(self.body_cmd_entry)
+
 	def toggle_sim_state(self):
 		if self.open_menus:
 			# if a MenuInstance is open, ignore p keypress
 			return
 
 		self.running = not self.running  # flip state
+		self.scheduler.reset()
 		self.update_sim_text(self.running)
 
 	def update_sim_text(self, running):
@@ -475,59 +642,177 @@ Close menu / Quit - [Esc]"""
 		else:  # if paused
 			self.sim_running_text.text = f"Simulation paused (continue @ {self.vClock_speed}x speed)"
 
-	def update_vclock(self, task):
-		self.vClock.setFrameRate(self.framerate / self.vClock_speed)  # sets the time factor
-		if self.running:
-			self.vClock.tick()
+	def start_frame(self, task):
+		self.scheduler.frame_started()
+		return task.cont
+
+	def finish_frame(self, task):
+		self.scheduler.frame_finished()
 		return task.cont
 
 	def calc_forces(self, task):
 		if not self.running:
 			return task.cont
 
-		dt = self.vClock.dt
+		# keep virtual time locked to wall-clock time, a single step is never longer than it used to be at the
+		# display's refresh rate
+		steps, dt = self.scheduler.plan(self.clock.getDt(), self.vClock_speed, self.vClock_speed / self.framerate)
 
-		# for each pair of celbodies, calculate force vector
-		for pair in self.celbody_pairs:
-			# newton's gravitational law (F = G*m1*m2/r^2 * ř)
-			magnitude = constants.G * pair[0].mass * pair[1].mass / (pair[0].distance_m(pair[1]) ** 3)
-			vec3_r = pair[0].vec3m_r(pair[1])
-			vec3_force = vec_mul(vec3_r, magnitude)
+		physics_time = 0.0
+		for _ in range(steps):
+			self.vClock.setDt(dt)
+			self.vClock.tick()
 
-			# append calculated vector to vector list
-			pair[0].l_vec3_f_forces.append(vec3_force)
-			pair[1].l_vec3_f_forces.append(vec_neg(vec3_force))
+			n = len(self.celbodies)
 
-		for celbody in self.celbodies:
-			celbody.vec3_f_fres = vec_sum(celbody.l_vec3_f_forces)  # sum up all forces exerted on the body
-			celbody.l_vec3_f_forces.clear()  # clear list of individual forces, making it ready for the next frame
+			# kick and drift every body, close pairs get sub-stepped separately
+			start = time.perf_counter()
+			self.close_pairs = physics.step(self.celbodies.pos_m[:n], self.celbodies.vel[:n], self.celbodies.mass[:n],
+											dt, self.softening, self.encounter_eta)
+			physics_time += time.perf_counter() - start
 
-			# using F = ma -> a = F/m calculate acceleration
-			celbody.vec3_f_accel = vec_mul(celbody.vec3_f_fres, 1 / celbody.mass)
+			self.elements.state_changed()
+		self.scheduler.physics_done(physics_time, steps)
 
-			# using v = a * dt calculate velocity change and new velocity
-			vec3_f_dv = vec_mul(celbody.vec3_f_accel, dt)
-			celbody.vec3_velocity = vec_sum([celbody.vec3_velocity, vec3_f_dv])  # add dv to previous v
+		# at most one state frame per rendered frame, however many substeps it took
+		if steps and self.telemetry and self.telemetry.step():
+			self.publish_state()
 
-			# using s = v * dt calculate displacement
-			vec3_f_disp = vec_mul(celbody.vec3_velocity, dt)
-			x, y, z = celbody.node.getPos()  # get xyz coords
+		# only bodies in view have scene nodes to update
+		self.celbodies.sync_nodes()
 
-			# add xyz components of displacement vector to corresponding variable
-			x += m_to_u(vec3_f_disp[0])  #
-			y += m_to_u(vec3_f_disp[1])  # convert from meters to panda3d units (personal definition: 1 u = 10^8 m)
-			z += m_to_u(vec3_f_disp[2])  #
+		return task.cont
 
-			# set the newly calculated position
-			celbody.node.setPos(x, y, z)
-			celbody.trail.update_motion_trail()
+	def update_trails(self, task):
+		if self.running and self.scheduler.due(self.scheduler.trail_every):
+			for celbody in self.celbodies.shown():
+				celbody.trail.update_motion_trail()
 
 		return task.cont
 
+	def publish_state(self):
+		n = len(self.celbodies)
+		self.telemetry.publish(self.vClock.getFrameTime(), self.celbodies.names, self.celbodies.version,
+							self.celbodies.pos_m[:n], self.celbodies.vel[:n])
+
+	def default_elements_primary(self):
+		if args.elements_primary in self.celbodies:
+			return args.elements_primary
+		n = len(self.celbodies)
+		return self.celbodies.records[int(np.argmax(self.celbodies.mass[:n]))].name if n else None
+
+	def set_elements_primary(self, name):
+		"""Makes the orbital elements relative to another body (None = no elements)"""
+
+		self.elements_primary = name
+		self.elements.request()
+
+	def primary_from_tracking(self):
+		if self.open_menus:
+			return
+
+		if self.trk_cb is not None and self.trk_cb.name != self.elements_primary:
+			self.set_elements_primary(self.trk_cb.name)
+		else:
+			self.set_elements_primary(self.default_elements_primary())
+		print(f"Orbital elements relative to {self.elements_primary}")
+
+	def compute_elements(self):
+		"""Computes the orbital elements of all bodies now (cached until the simulation state changes)"""
+
+		if self.open_menus or self.elements_primary is None:
+			return
+
+		self.elements.compute(*self.element_args())
+
+	def update_elements(self, task):
+		# refreshes the orbital elements on a wall-clock schedule, a few rows per frame
+		if self.elements_primary is not None:
+			self.elements.update(*self.element_args())
+
+		return task.cont
+
+	def element_args(self):
+		n = len(self.celbodies)
+		watch = (self.trk_cb.index,) if self.trk_cb is not None else ()
+		return (self.vClock.getFrameTime(), self.celbodies.names, self.celbodies.version, self.celbodies.pos_m[:n],
+				self.celbodies.vel[:n], self.celbodies.mass[:n], self.celbodies[self.elements_primary].index, watch)
+
+	def export_elements(self, path="orbital_elements.csv"):
+		if self.open_menus:
+			return
+
+		self.elements.export(path)
+		print(f"Exported {len(self.elements.samples)} orbital element samples to '{path}'")
+
+	def update_orbit_text(self, task):
+		if not self.scheduler.due(self.scheduler.hud_every):
+			return task.cont
+
+		if self.trk_cb is None:
+			self.orbit_text.text = ""
+			return task.cont
+
+		el = self.elements.get(self.trk_cb.name)
+		if el is None or np.isnan(el[1]):
+			self.orbit_text.text = f"Orbit ({self.trk_cb.name}): --"
+			return task.cont
+
+		a, e, i, period = el
+		period_text = f"{period / 86400:.2f} d" if not np.isnan(period) else "unbound"
+		self.orbit_text.text = (f"Orbit ({self.trk_cb.name} around {self.elements.primary}): "
+								f"a = {a / constants.au:.4f} AU, e = {e:.4f}, i = {i:.2f}°, T = {period_text}")
+
+		return task.cont
+
+	def cycle_field_overlay(self):
+		"""Switches the field overlay between off, inertial frame and the frame co-rotating with the tracked body"""
+
+		if self.open_menus or self.elements_primary is None:
+			return
+
+		if not self.field.shown:
+			self.field.show(self.elements_primary)
+		elif (self.field.rotating is None and self.trk_cb is not None
+			and self.trk_cb.name != self.elements_primary):
+			self.field.show(self.elements_primary, (self.elements_primary, self.trk_cb.name))
+		else:
+			self.field.hide()
+
+	def print_memory_report(self):
+		if self.open_menus:
+			return
+		print(self.celbodies.memory_report())
+
+	def update_scene_nodes(self, task):
+		self.celbodies.update_visibility()
+		return task.cont
+
 	def update_time_counter(self, task):
+		if not self.scheduler.due(self.scheduler.hud_every):
+			return task.cont
+
 		self.realtime_elapsed_text.text = f"Realtime elapsed = {round(self.clock.getFrameTime(), 3)} s"
 		self.vtime_elapsed_text.text = f"Virtual time elapsed = {datetime.timedelta(seconds=self.vClock.getFrameTime())}"
 
+		if self.close_pairs:
+			names = self.celbodies.names
+			pairs = ", ".join(f"{names[i]}-{names[j]}" for i, j in self.close_pairs[:3])
+			more = f" (+{len(self.close_pairs) - 3})" if len(self.close_pairs) > 3 else ""
+			self.encounter_text.text = f"Close encounters: {pairs}{more}"
+		else:
+			self.encounter_text.text = ""
+
+		sched = self.scheduler
+		steps_text = f"Physics steps/frame = {sched.substeps}"
+		# the simulation can't keep up with the requested speed (right now / in the last few seconds)
+		if sched.backlog > 0:
+			steps_text += f", behind by {datetime.timedelta(seconds=round(sched.backlog))}"
+		lost = sched.recently_dropped()
+		if lost > 0:
+			steps_text += f", lost {datetime.timedelta(seconds=round(lost))} in the last {sched.report_s:.0f} s"
+		self.sim_steps_text.text = steps_text
+
 		return task.cont
 
 	def camera_change_speed(self, inc):
@@ -557,10 +842,11 @@ Close menu / Quit - [Esc]"""
 			return task.cont
 
 		cam_x, cam_y, cam_z = self.camera.getPos()
-		self.cam_pos_text.text = f"Cam xyz = ({cam_x:.3f}, {cam_y:.3f}, {cam_z:.3f})"
-
 		movement_speed = self.cam_base_spd * self.camera_speed_mod(2)
-		self.cam_spd_text.text = f"Cam speed = {movement_speed} units/frame"
+
+		if self.scheduler.due(self.scheduler.hud_every):
+			self.cam_pos_text.text = f"Cam xyz = ({cam_x:.3f}, {cam_y:.3f}, {cam_z:.3f})"
+			self.cam_spd_text.text = f"Cam speed = {movement_speed} units/frame"
 
 		cam_h, cam_p, cam_r = self.camera.getHpr()
 		cam_h *= pi / 180  # conversion to radians
@@ -649,6 +935,12 @@ Close menu / Quit - [Esc]"""
 
 		return task.cont
 
+	def userExit(self):
+		self.field.close()
+		if self.telemetry:
+			self.telemetry.stop()
+		ShowBase.userExit(self)
+
 	# closes MenuInstance if applicable, otherwise quits app
 	def esc_handler(self):
 		if self.open_menus:
@@ -0,0 +1,97 @@
+from math import tan, radians
+
+import numpy as np
+
+from registry import view_coords
+from tools import m_to_u
+
+
+class NametagLayer:
+	"""
+	Places, orients and declutters the name tags of all bodies in one batch
+
+	Every update the label anchors of all bodies are transformed into camera space at once. Labels outside the view
+	frustum are skipped, the remaining ones are binned into a screen-space grid of roughly label-sized cells. Going
+	from the most important label down (selected bodies first, then by ``priority``: "mass" or "proximity"), a label
+	is only shown if its cell and the 8 neighbouring ones are still free. Only the shown labels are touched through the scene graph, so the Python work grows with the number of visible
+	labels instead of the number of bodies.
+	"""
+
+	def __init__(self, base, registry, cell_px=(140, 28), priority="mass"):
+		self.base = base
+		self.registry = registry
+		self.cell_px = cell_px  # width and height of a grid cell in pixels, about the size of a label
+		self.priority = priority
+
+		self.shown = set()  # CelBody records whose labels are currently shown
+
+	def update(self):
+		reg = self.registry
+		n = len(reg)
+
+		# only bodies with scene nodes have a name tag
+		idx = np.flatnonzero(reg.has_node[:n])
+		anchors = m_to_u(reg.pos_m[idx])
+		anchors[:, 2] += 1.2 * reg.radius[idx]  # place name tag slightly above CelBody
+
+		x, y, z = view_coords(self.base.camera, self.base.render, anchors).T
+
+		fov_h, fov_v = self.base.camLens.getFov()
+		tan_h, tan_v = tan(radians(fov_h / 2)), tan(radians(fov_v / 2))
+		near = self.base.camLens.getNear()
+
+		in_view = (y > near) & (np.abs(x) <= y * tan_h) & (np.abs(z) <= y * tan_v)
+		idx, anchors, x, y, z = idx[in_view], anchors[in_view], x[in_view], y[in_view], z[in_view]
+
+		# screen-space grid cell of every label, from normalized device coordinates
+		cols = max(1, self.base.win.getXSize() // self.cell_px[0])
+		rows = max(1, self.base.win.getYSize() // self.cell_px[1])
+		col = np.minimum(((x / (y * tan_h) + 1) / 2 * cols).astype(int), cols - 1)
+		row = np.minimum(((z / (y * tan_v) + 1) / 2 * rows).astype(int), rows - 1)
+		cell = row * cols + col
+
+		dist = np.sqrt(x * x + y * y + z * z)
+		if self.priority == "proximity":
+			importance = -dist
+		else:
+			with np.errstate(divide='ignore'):
+				importance = np.log10(reg.mass[idx])
+		importance = np.where(reg.selected[idx], np.inf, importance)
+
+		# only the most important label of every cell is a candidate
+		order = np.lexsort((-importance, cell))
+		_, first = np.unique(cell[order], return_index=True)
+		candidates = order[first]
+
+		# most important first, a label is only shown if neither its cell nor one of the 8 around it holds one
+		# already, so labels on both sides of a cell border don't overlap either
+		ranked = candidates[np.argsort(-importance[candidates], kind='stable')]
+		taken = set()
+		winners = []
+		for k, r, c in zip(ranked.tolist(), row[ranked].tolist(), col[ranked].tolist()):
+			if any((r + dr, c + dc) in taken for dr in (-1, 0, 1) for dc in (-1, 0, 1)):
+				continue
+			taken.add((r, c))
+			winners.append(k)
+		winners = np.array(winners, dtype=int)
+
+		cam_x, cam_y, cam_z = self.base.camera.getPos(self.base.render)
+		vec3_d = np.array((cam_x, cam_y, cam_z)) - anchors[winners]
+
+		# billboard heading/pitch and distance dependent scale for all shown labels at once
+		heading = np.degrees(np.arctan2(vec3_d[:, 1], vec3_d[:, 0])) + 90
+		pitch = np.degrees(np.arctan2(-vec3_d[:, 2], np.hypot(vec3_d[:, 0], vec3_d[:, 1])))
+		scale = 0.1 * dist[winners] ** (1 / 1.1)  # make name tag bigger the further away camera is
+
+		shown = set()
+		for i, (ax, ay, az), h, p, s in zip(idx[winners].tolist(), anchors[winners].tolist(), heading.tolist(),
+											pitch.tolist(), scale.tolist()):
+			cb = reg.records[i]
+			cb.nametag_np.setPosHprScale(ax, ay, az, h, p, 0, s, s, s)
+			cb.nametag_np.show()
+			shown.add(cb)
+
+		for cb in self.shown - shown:
+			if cb.nametag_np is not None:
+				cb.nametag_np.hide()
+		self.shown = shown
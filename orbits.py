@@ -0,0 +1,232 @@
+import csv
+import time
+from collections import deque
+from math import inf
+
+import numpy as np
+from scipy import constants
+
+# columns of the arrays returned by state_to_elements
+ELEMENT_FIELDS = ("semi_major_axis_m", "eccentricity", "inclination_deg", "period_s")
+
+
+def state_to_elements(pos_m, vel, primary_pos_m, primary_vel, mu):
+	"""
+	Converts state vectors of many bodies to Keplerian elements in one go
+
+	:param pos_m: (n, 3) array of positions in meters
+	:param vel: (n, 3) array of velocities in m/s
+	:param primary_pos_m: position of the primary in meters
+	:param primary_vel: velocity of the primary in m/s
+	:param mu: gravitational parameter G*(M + m) in m^3/s^2, scalar or (n,) array
+	:return: (n, 4) array, columns as in ``ELEMENT_FIELDS``; rows that have no orbit (e.g. the primary itself) are NaN
+	"""
+	r = np.asarray(pos_m, dtype=np.float64) - np.asarray(primary_pos_m, dtype=np.float64)
+	v = np.asarray(vel, dtype=np.float64) - np.asarray(primary_vel, dtype=np.float64)
+	mu = np.asarray(mu, dtype=np.float64)
+
+	out = np.full((len(r), len(ELEMENT_FIELDS)), np.nan)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		r_mag = np.sqrt(np.einsum('ij,ij->i', r, r))
+		v_sq = np.einsum('ij,ij->i', v, v)
+		r_dot_v = np.einsum('ij,ij->i', r, v)
+
+		h = np.cross(r, v)  # specific angular momentum
+		h_mag = np.sqrt(np.einsum('ij,ij->i', h, h))
+
+		energy = v_sq / 2 - mu / r_mag  # specific orbital energy
+		a = -mu / (2 * energy)  # negative for hyperbolic orbits
+
+		# eccentricity vector e = ((v^2 - mu/r) * r - (r.v) * v) / mu
+		e_vec = ((v_sq - mu / r_mag)[:, None] * r - r_dot_v[:, None] * v) / np.atleast_1d(mu)[:, None]
+
+		out[:, 0] = a
+		out[:, 1] = np.sqrt(np.einsum('ij,ij->i', e_vec, e_vec))
+		out[:, 2] = np.degrees(np.arccos(np.clip(h[:, 2] / h_mag, -1, 1)))
+		out[:, 3] = np.where(a > 0, 2 * np.pi * np.sqrt(a ** 3 / mu), np.nan)  # only bound orbits have a period
+
+	out[~(r_mag > 0)] = np.nan  # the primary (or anything sitting on top of it) has no orbit around it
+	return out
+
+
+class ElementTracker:
+	"""
+	Keeps the orbital elements of all bodies relative to a primary up to date and records them as time series
+
+	A refresh starts every ``interval_s`` seconds of wall-clock time (if the simulation state changed in between).
+	The watched bodies (e.g. the tracked one) are done right away; every ``full_every``-th refresh also does all
+	other bodies, from a snapshot of the state in blocks of ``block_rows`` rows spread over the following frames
+	(see ``update``), so large body counts don't stall a frame. ``compute`` does everything at once.
+
+	The watched bodies are recorded on every refresh, all bodies only on the full ones. The oldest samples are
+	dropped once more than ``max_rows`` rows (one body at one point in time) are recorded.
+	"""
+
+	def __init__(self, interval_s=0.5, full_every=10, block_rows=4096, max_rows=500_000):
+		self.interval_s = interval_s
+		self.full_every = full_every
+		self.block_rows = block_rows
+		self.max_rows = max_rows
+
+		self.values = None  # (n, 4) array of the latest elements of all bodies
+		self.names = ()  # body names matching the rows of self.values
+		self.version = None  # registry version self.names was copied at
+		self.primary = None  # name of the primary the elements are relative to
+		self.time = None  # virtual time of the latest refresh
+		self.watched = {}  # name -> latest elements of the watched bodies
+
+		# time series of (time, primary, names, elements); stored as float32 to keep large runs in memory
+		self.samples = deque()
+		self.rows = 0  # number of rows in self.samples
+
+		self._valid = False
+		self._values_valid = False  # self.values matches the current state
+		self._last = -inf  # wall-clock time of the latest refresh
+		self._refreshes = 0
+		self._refresh = None
+		self._rows_of = None  # name -> row of self.values, built on first use
+
+	# has to be called after every physics step
+	def state_changed(self):
+		self._valid = False
+		self._values_valid = False
+
+	# makes the next update start a refresh, e.g. when another body should be watched
+	def request(self):
+		self._valid = False
+		self._last = -inf
+
+	@property
+	def due(self):
+		return not self._valid and self._refresh is None and time.perf_counter() - self._last >= self.interval_s
+
+	def update(self, t, names, version, pos_m, vel, mass, primary, watch=(), budget_s=0.002):
+		"""
+		Starts a refresh if one is due and continues it until ``budget_s`` is used up, has to be called every frame
+
+		:param t: current virtual time in s
+		:param names: sequence of body names matching the rows of the state arrays, copied only when it changed
+		:param version: number that changes whenever ``names`` changes
+		:param pos_m: (n, 3) array of positions in meters
+		:param vel: (n, 3) array of velocities in m/s
+		:param mass: (n,) array of masses in kg
+		:param primary: index of the primary body
+		:param watch: indices of the bodies to refresh and record every time
+		:param budget_s: time this call may take
+		"""
+		if self._refresh is None:
+			if not self.due:
+				return
+			self._refreshes += 1
+			self._refresh = self._compute(t, names, version, pos_m, vel, mass, primary, watch,
+										self._refreshes % self.full_every == 0 or self.values is None)
+
+		# at least one step, the first one takes the snapshot
+		deadline = time.perf_counter() + budget_s
+		while True:
+			try:
+				next(self._refresh)
+			except StopIteration:
+				self._refresh = None
+				break
+			if time.perf_counter() >= deadline:
+				break
+
+	def compute(self, t, names, version, pos_m, vel, mass, primary, watch=()):
+		"""
+		Returns the elements of all bodies, recomputing them only if the state changed since the last call
+
+		Parameters as for ``update``.
+		"""
+		if (self._values_valid and self._refresh is None and version == self.version
+				and names[primary] == self.primary):
+			return self.values
+
+		self._refresh = None  # superseded
+		for _ in self._compute(t, names, version, pos_m, vel, mass, primary, watch, True):
+			pass
+		return self.values
+
+	def _compute(self, t, names, version, pos_m, vel, mass, primary, watch, full):
+		"""Generator refreshing the elements, yields after every block of rows"""
+
+		self._valid = True
+		self._last = time.perf_counter()
+
+		mass = np.asarray(mass, dtype=np.float64)
+		mu = constants.G * (mass[primary] + mass)
+		primary_name = names[primary]
+
+		watch = np.asarray(watch, dtype=int)
+		watched = state_to_elements(pos_m[watch], vel[watch], pos_m[primary], vel[primary], mu[watch])
+		watched_names = tuple(names[i] for i in watch.tolist())
+		self.watched = dict(zip(watched_names, watched))
+		self.primary = primary_name
+		self.time = t
+		if not full:
+			if watched_names:
+				self._record(t, primary_name, watched_names, watched)
+			return
+
+		# the remaining blocks run in later frames, work on a snapshot
+		self._values_valid = True
+		pos_m, vel = pos_m.copy(), vel.copy()
+		names = self.names if version == self.version else tuple(names)
+		values = np.empty((len(names), len(ELEMENT_FIELDS)))
+		for start in range(0, len(names), self.block_rows):
+			block = slice(start, start + self.block_rows)
+			values[block] = state_to_elements(pos_m[block], vel[block], pos_m[primary], vel[primary], mu[block])
+			yield
+
+		self.values = values
+		if version != self.version:
+			self.names = names
+			self.version = version
+			self._rows_of = None
+		self._record(t, primary_name, names, values)
+
+	def _record(self, t, primary, names, values):
+		self.samples.append((t, primary, names, values.astype(np.float32)))
+		self.rows += len(values)
+		while self.rows > self.max_rows and len(self.samples) > 1:
+			self.rows -= len(self.samples.popleft()[3])
+
+	# returns the latest elements of a single body (or None)
+	def get(self, name):
+		if name in self.watched:
+			return self.watched[name]
+		if self.values is None:
+			return None
+		if self._rows_of is None:
+			self._rows_of = {n: i for i, n in enumerate(self.names)}
+		i = self._rows_of.get(name)
+		return None if i is None else self.values[i]
+
+	def export(self, path):
+		"""
+		Writes the recorded time series to disk
+
+		``.npz`` files get one (samples, 4) array per body plus a matching time array,
+		anything else is written as CSV with one row per body and sample.
+		"""
+		if str(path).endswith(".npz"):
+			series = {}
+			for t, primary, names, values in self.samples:
+				for name, row in zip(names, values):
+					series.setdefault(name, ([], []))
+					series[name][0].append(t)
+					series[name][1].append(row)
+			arrays = {"fields": np.array(ELEMENT_FIELDS)}
+			for name, (times, rows) in series.items():
+				arrays[f"{name}/time_s"] = np.array(times)
+				arrays[f"{name}/elements"] = np.array(rows)
+			np.savez_compressed(path, **arrays)
+			return
+
+		with open(path, "w", newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(("time_s", "body", "primary") + ELEMENT_FIELDS)
+			for t, primary, names, values in self.samples:
+				for name, row in zip(names, values.tolist()):
+					writer.writerow((t, name, primary, *row))
@@ -0,0 +1,223 @@
+from math import sqrt, pi
+
+import numpy as np
+from scipy import constants
+
+# upper limit for the number of pairwise terms held in memory at once
+CHUNK_ELEMENTS = 1 << 20
+
+
+def field_at(points, pos_m, mass, softening=0.0, accel=False):
+	"""
+	Evaluates the gravitational potential (or acceleration) of all bodies at the given points by direct summation
+
+	Without softening a point sitting right on a body gets nothing from that body.
+
+	:param points: (k, 3) array of points in meters
+	:param pos_m: (n, 3) array of body positions in meters
+	:param mass: (n,) array of masses in kg
+	:param softening: Plummer softening length in meters
+	:param accel: return (k, 3) accelerations in m/s^2 instead of the (k,) potential in J/kg
+	"""
+	out = np.zeros((len(points), 3) if accel else len(points))
+	eps_sq = softening ** 2
+
+	for rows, vec3_r, r_sq in _separations(points, pos_m):
+		if accel:
+			out[rows] = _accel_terms(vec3_r, r_sq, mass, eps_sq)
+		else:
+			out[rows] = -constants.G * (_inv_pow(r_sq, eps_sq, 0.5) @ mass)
+
+	return out
+
+
+def _separations(points, pos_m):
+	"""
+	Yields ``(rows, vec3_r, r_sq)`` for blocks of points: the vectors from every point in the block to all bodies
+	and their squared lengths
+
+	The blocks are sized to hold at most ``CHUNK_ELEMENTS`` pairwise terms, so memory stays bounded for large counts.
+	"""
+	chunk = max(1, CHUNK_ELEMENTS // max(len(pos_m), 1))
+	for start in range(0, len(points), chunk):
+		rows = slice(start, min(start + chunk, len(points)))
+		vec3_r = pos_m[None, :, :] - points[rows, None, :]
+		yield rows, vec3_r, np.einsum('ijk,ijk->ij', vec3_r, vec3_r)
+
+
+def _accel_terms(vec3_r, r_sq, mass, eps_sq):
+	# newton's gravitational law (a = G*m/r^2 * ř) with Plummer softening, a body doesn't attract itself
+	return constants.G * np.einsum('ij,ijk->ik', mass[None, :] * _inv_pow(r_sq, eps_sq, 1.5), vec3_r)
+
+
+def _inv_pow(r_sq, eps_sq, p):
+	# (r^2 + eps^2)^-p, terms with r = 0 are zero unless softened
+	if eps_sq > 0:
+		return (r_sq + eps_sq) ** -p
+	out = np.zeros_like(r_sq)
+	nonzero = r_sq > 0
+	out[nonzero] = r_sq[nonzero] ** -p
+	return out
+
+
+def _pairwise(pos_m, mass, softening, dt_over_eta):
+	"""
+	Calculates the gravitational acceleration of every body caused by all other bodies and finds the close pairs
+
+	Returns ``(accel, i, j, t_dyn)``: (n, 3) accelerations in m/s^2 and the close pairs with their dynamical times.
+
+	A pair counts as close when the step ``dt`` exceeds ``eta`` times its dynamical time sqrt(r^3 / (G*(m_i + m_j))).
+	"""
+	n = len(pos_m)
+	accel = np.zeros((n, 3))
+	eps_sq = softening ** 2
+	close = []
+
+	for rows, vec3_r, r_sq in _separations(pos_m, pos_m):
+		accel[rows] = _accel_terms(vec3_r, r_sq, mass, eps_sq)
+
+		if dt_over_eta > 0:
+			# coincident bodies have no orbit to regularize
+			t_dyn_sq = r_sq ** 1.5 / (constants.G * (mass[rows, None] + mass[None, :]))
+			i, j = np.nonzero((r_sq > 0) & (t_dyn_sq < dt_over_eta ** 2)
+							& (np.arange(n)[None, :] > np.arange(rows.start, rows.stop)[:, None]))
+			if len(i):
+				close.append((i + rows.start, j, np.sqrt(t_dyn_sq[i, j])))
+
+	if close:
+		i, j, t_dyn = (np.concatenate(c) for c in zip(*close))
+	else:
+		i, j, t_dyn = np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+	return accel, i, j, t_dyn
+
+
+def step(pos_m, vel, mass, dt, softening=0.0, eta=0.0):
+	"""
+	Advances all bodies by ``dt`` (in place)
+
+	Every body gets one kick and one drift. Pairs that are too close to be resolved by ``dt`` (see ``_pairwise``,
+	``eta`` = 0 disables this) are taken out of the bulk step: their centre of mass moves with the bulk and their
+	relative motion is sub-stepped with ``kepler_step``. Each body is part of at most one such pair, the pairs
+	with the shortest dynamical time are picked first.
+
+	:param pos_m: (n, 3) array of positions in meters
+	:param vel: (n, 3) array of velocities in m/s
+	:param mass: (n,) array of masses in kg
+	:param dt: time step in s
+	:param softening: Plummer softening length in meters, not applied to regularized pairs
+	:param eta: maximum fraction of a pair's dynamical time a step may span before the pair gets regularized
+	:return: list of the regularized pairs ``(i, j)``
+	"""
+	accel, close_i, close_j, t_dyn = _pairwise(pos_m, mass, softening, dt / eta if eta > 0 else 0.0)
+
+	pairs = []
+	used = set()
+	for k in np.argsort(t_dyn).tolist():
+		i, j = int(close_i[k]), int(close_j[k])
+		if i in used or j in used:
+			continue
+		used.update((i, j))
+		pairs.append((i, j))
+
+		# the pair's mutual attraction is handled by kepler_step, so take the softened term back out
+		vec3_r = pos_m[j] - pos_m[i]
+		inv_r3 = (vec3_r @ vec3_r + softening ** 2) ** -1.5
+		accel[i] -= constants.G * mass[j] * inv_r3 * vec3_r
+		accel[j] += constants.G * mass[i] * inv_r3 * vec3_r
+
+	vel += accel * dt  # using v = a * dt calculate velocity change and new velocity
+
+	# centre of mass and relative state of every pair after the kick
+	pair_states = []
+	for i, j in pairs:
+		m = mass[i] + mass[j]
+		pair_states.append(((mass[i] * pos_m[i] + mass[j] * pos_m[j]) / m,
+							(mass[i] * vel[i] + mass[j] * vel[j]) / m,
+							pos_m[j] - pos_m[i],
+							vel[j] - vel[i]))
+
+	pos_m += vel * dt  # using s = v * dt calculate displacement
+
+	for (i, j), (cm_pos, cm_vel, vec3_r, vec3_v) in zip(pairs, pair_states):
+		m = mass[i] + mass[j]
+		vec3_r, vec3_v = kepler_step(vec3_r, vec3_v, constants.G * m, dt)
+		cm_pos = cm_pos + cm_vel * dt
+
+		pos_m[i] = cm_pos - mass[j] / m * vec3_r
+		pos_m[j] = cm_pos + mass[i] / m * vec3_r
+		vel[i] = cm_vel - mass[j] / m * vec3_v
+		vel[j] = cm_vel + mass[i] / m * vec3_v
+
+	return pairs
+
+
+def kepler_step(vec3_r, vec3_v, mu, dt, substeps_per_orbit=256, max_substeps=2000):
+	"""
+	Advances the relative motion of an isolated pair by ``dt`` with the time-transformed (logarithmic Hamiltonian)
+	leapfrog of Mikkola & Tanikawa / Preto & Tremaine
+
+	The time transformation shrinks the physical step automatically near pericentre, so even near-collisions keep
+	their energy and orbit shape; for the Kepler problem only the orbital phase picks up an error. The fictitious step
+	is chosen for ``substeps_per_orbit`` steps per orbit, but enlarged if ``dt`` would need more than
+	``max_substeps``. The last substep is shortened (by bisection) to end exactly at ``dt``.
+
+	:param vec3_r: relative position in meters
+	:param vec3_v: relative velocity in m/s
+	:param mu: G*(m1 + m2) in m^3/s^2
+	:param dt: time step in s
+	:return: new relative position and velocity as arrays
+	"""
+	state = tuple(float(c) for c in vec3_r) + tuple(float(c) for c in vec3_v)
+	x, y, z, vx, vy, vz = state
+
+	r0 = sqrt(x * x + y * y + z * z)
+	if r0 == 0:
+		# coincident bodies, there is no relative orbit to follow, just drift apart
+		return np.array((vx * dt, vy * dt, vz * dt)), np.array((vx, vy, vz))
+
+	b = mu / r0 - 0.5 * (vx * vx + vy * vy + vz * vz)  # binding energy, stays constant for an isolated pair
+
+	# the fictitious time per orbit is 2*pi*sqrt(mu*a) and it passes at a mean rate of mu/a,
+	# unbound pairs use their current separation instead of the semi-major axis
+	length = mu / (2 * b) if b > 0 else r0
+	h = max(2 * pi * sqrt(mu * length) / substeps_per_orbit, dt * mu / length / max_substeps)  # fictitious time step
+
+	t = 0.0
+	for _ in range(2 * max_substeps):
+		new_state, elapsed = _logh_substep(state, b, h)
+		if t + elapsed >= dt:
+			break
+		state = new_state
+		t += elapsed
+
+	# the physical time covered by a substep grows monotonically with h, so bisect for the remaining time
+	lo, hi = 0.0, h
+	for _ in range(50):
+		mid = 0.5 * (lo + hi)
+		if t + _logh_substep(state, b, mid)[1] < dt:
+			lo = mid
+		else:
+			hi = mid
+	state = _logh_substep(state, b, 0.5 * (lo + hi))[0]
+
+	return np.array(state[:3]), np.array(state[3:])
+
+
+def _logh_substep(state, b, h):
+	"""One drift-kick-drift substep of fictitious length ``h``, returns the new state and the physical time it took"""
+
+	x, y, z, vx, vy, vz = state
+
+	# drift (half step): dq/ds = p / (T + B), dt/ds = 1 / (T + B)
+	d1 = 0.5 * h / max(0.5 * (vx * vx + vy * vy + vz * vz) + b, 1e-300)
+	x, y, z = x + vx * d1, y + vy * d1, z + vz * d1
+
+	# kick: dp/ds = grad(U) / U = -q / |q|^2
+	r_sq = x * x + y * y + z * z
+	vx, vy, vz = vx - h * x / r_sq, vy - h * y / r_sq, vz - h * z / r_sq
+
+	# drift (half step)
+	d2 = 0.5 * h / max(0.5 * (vx * vx + vy * vy + vz * vz) + b, 1e-300)
+	x, y, z = x + vx * d2, y + vy * d2, z + vz * d2
+
+	return (x, y, z, vx, vy, vz), d1 + d2
@@ -0,0 +1,208 @@
+import sys
+from math import tan, cos, radians
+
+import numpy as np
+from panda3d.core import Mat4
+
+from celbody import CelBody
+from tools import m_to_u
+
+
+def view_coords(camera, render, pts_u):
+	"""
+	Transforms points into the camera's coordinate system (x right, y forward, z up)
+
+	:param camera: camera NodePath
+	:param render: scene root NodePath
+	:param pts_u: (n, 3) array of points in panda3d units
+	"""
+	mat = Mat4(camera.getMat(render))
+	mat.invertInPlace()
+	m = np.array([tuple(mat.getRow(i)) for i in range(4)])
+	return pts_u @ m[:3, :3] + m[3, :3]  # panda3d uses row vectors
+
+
+class BodyRegistry:
+	"""
+	Stores the celestial bodies of the simulation
+
+	Physical properties are kept in numpy arrays (one row per body) which are used directly by the physics code,
+	the ``CelBody`` records only hold the per-body data that isn't needed for the calculations. Scene graph nodes
+	are created for bodies inside the view frustum (at most ``max_nodes``, the apparently largest ones win) and
+	for selected bodies; they are released again once a body has been out of view for ``release_after`` updates.
+
+	Bodies can be added and removed at any time. The arrays grow by doubling and a removed body's row is filled
+	with the last one, so neither depends on the number of bodies (apart from the occasional regrowth).
+	Row indices (and the order of ``names``) therefore change on removal, ``version`` is incremented on every change;
+	whoever keeps the names across changes has to copy them when it sees a new version.
+	"""
+
+	_ARRAYS = ("pos_m", "vel", "mass", "radius", "has_node", "selected", "hidden_for")
+
+	def __init__(self, base, capacity, max_nodes=500, release_after=120):
+		self.base = base
+		self.max_nodes = max_nodes
+		self.release_after = release_after
+
+		self.count = 0
+		self.version = 0
+		self.pos_m = np.zeros((capacity, 3))  # positions in meters
+		self.vel = np.zeros((capacity, 3))  # velocities in m/s
+		self.mass = np.zeros(capacity)  # masses in kg
+		self.radius = np.zeros(capacity)  # radii in panda3d units
+
+		self.has_node = np.zeros(capacity, dtype=bool)
+		self.selected = np.zeros(capacity, dtype=bool)
+		self.hidden_for = np.zeros(capacity, dtype=np.int32)  # number of updates a body has been out of view
+
+		self.records: list[CelBody] = []
+		self.names: list[str] = []  # body names in row order, changes in place (see version)
+		self._by_name = {}
+		self._models = {}  # model path -> loaded model, instanced by every body using it
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		return iter(self.records)
+
+	def __contains__(self, name):
+		return name in self._by_name
+
+	def __getitem__(self, name) -> CelBody:
+		return self._by_name[name]
+
+	def add(self, name, model_path, pos_m, radius, mass, vec3_velocity, color):
+		"""
+		Adds a body to the registry
+
+		:param pos_m: position in meters
+		:param radius: radius in panda3d units
+		:param mass: mass in kg
+		:param vec3_velocity: velocity in m/s
+		:param color: RGBA color, components between 0 and 1
+		"""
+		if name in self._by_name:
+			raise ValueError(f"there already is a body called '{name}'")
+		if self.count == len(self.mass):
+			self._grow()
+
+		i = self.count
+		self.pos_m[i] = pos_m
+		self.vel[i] = vec3_velocity
+		self.mass[i] = mass
+		self.radius[i] = radius
+
+		cb = CelBody(self, i, name, model_path, radius, color)
+		self.records.append(cb)
+		self.names.append(name)
+		self._by_name[name] = cb
+		self.count += 1
+		self.version += 1
+		return cb
+
+	def remove(self, name):
+		"""Removes a body, the last body takes over its row"""
+
+		cb = self._by_name.pop(name)
+		cb.release_nodes()
+
+		i, last = cb.index, self.count - 1
+		if i != last:
+			for attr in self._ARRAYS:
+				arr = getattr(self, attr)
+				arr[i] = arr[last]
+			moved = self.records[last]
+			moved.index = i
+			self.records[i] = moved
+			self.names[i] = moved.name
+		self.records.pop()
+		self.names.pop()
+
+		self.has_node[last] = False
+		self.selected[last] = False
+		self.hidden_for[last] = 0
+
+		self.count -= 1
+		self.version += 1
+
+	def _grow(self):
+		capacity = max(2 * len(self.mass), 16)
+		for attr in self._ARRAYS:
+			old = getattr(self, attr)
+			new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+			new[:self.count] = old[:self.count]
+			setattr(self, attr, new)
+
+	def model(self, path):
+		if path not in self._models:
+			self._models[path] = self.base.loader.loadModel(path)
+		return self._models[path]
+
+	def select(self, cb: CelBody, selected=True):
+		"""Selected bodies keep their scene graph nodes even when out of view"""
+
+		self.selected[cb.index] = selected
+		if selected:
+			self._create_nodes(cb.index)
+
+	# bodies that currently have scene graph nodes
+	def shown(self):
+		return [self.records[i] for i in np.flatnonzero(self.has_node[:self.count])]
+
+	def sync_nodes(self):
+		"""Moves the scene graph nodes to the current positions"""
+
+		idx = np.flatnonzero(self.has_node[:self.count])
+		for i, pos in zip(idx.tolist(), m_to_u(self.pos_m[idx]).tolist()):
+			self.records[i].node.setPos(*pos)
+
+	def update_visibility(self):
+		"""Creates scene graph nodes for bodies that came into view and releases those of long hidden ones"""
+
+		n = self.count
+		if n == 0:
+			return
+
+		x, y, z = view_coords(self.base.camera, self.base.render, m_to_u(self.pos_m[:n])).T
+		r = self.radius[:n]
+
+		fov_h, fov_v = self.base.camLens.getFov()
+		tan_h, tan_v = tan(radians(fov_h / 2)), tan(radians(fov_v / 2))
+		sec_h, sec_v = 1 / cos(radians(fov_h / 2)), 1 / cos(radians(fov_v / 2))
+
+		# sphere vs. view frustum (near and far planes are ignored)
+		in_view = (y > -r) & (np.abs(x) - y * tan_h <= r * sec_h) & (np.abs(z) - y * tan_v <= r * sec_v)
+
+		idx = np.flatnonzero(in_view)
+		if len(idx) > self.max_nodes:
+			apparent_size = r[idx] / np.maximum(y[idx], r[idx])
+			idx = idx[np.argpartition(-apparent_size, self.max_nodes)[:self.max_nodes]]
+			in_view[:] = False
+			in_view[idx] = True
+
+		self.hidden_for[:n] = np.where(in_view, 0, self.hidden_for[:n] + 1)
+
+		for i in idx[~self.has_node[idx]].tolist():
+			self._create_nodes(i)
+
+		stale = self.has_node[:n] & ~self.selected[:n] & (self.hidden_for[:n] > self.release_after)
+		for i in np.flatnonzero(stale).tolist():
+			self.records[i].release_nodes()
+			self.has_node[i] = False
+
+	def _create_nodes(self, i):
+		self.records[i].create_nodes()
+		self.has_node[i] = True
+
+	def memory_report(self):
+		"""Returns a short summary of the memory used per body"""
+
+		n = max(self.count, 1)
+		array_bytes = sum(getattr(self, attr).nbytes // max(len(self.mass), 1) for attr in self._ARRAYS)
+		record_bytes = sum(sys.getsizeof(cb) for cb in self.records) / n
+		shown = self.shown()
+		trail_pts = sum(len(cb.trail.trail_pts) for cb in shown)
+
+		return (f"{self.count} bodies: {array_bytes} B arrays + {record_bytes:.0f} B record per body, "
+				f"{len(shown)} with scene nodes ({trail_pts} trail points)")
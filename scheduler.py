@@ -0,0 +1,138 @@
+import time
+from collections import deque
+from math import ceil
+
+
+class FrameScheduler:
+	"""
+	Fits the per-frame work into a frame-time budget
+
+	The simulation advances by the measured wall-clock time of the frame times the simulation speed. That interval is
+	split into as many physics substeps as fit into what the rest of the frame leaves of the budget (measured cost
+	per step), up to ``max_substeps`` - spare time makes the steps smaller. A step is never longer than ``max_step``;
+	if that would be needed, the remaining time is carried over to the next frames. More than ``max_backlog_s`` worth
+	of real time can't be caught up with and is dropped. Both are reported via ``backlog`` and ``dropped`` (since the
+	last ``reset``), ``recently_dropped`` only counts the losses of the last ``report_s`` seconds.
+
+	The rest of the frame is measured as well: the app's other tasks between ``frame_started`` and ``frame_finished``
+	(``task_time``) and everything outside of them, mostly rendering (``render_time``). The latter can only be told
+	apart from waiting for the next frame when a frame took longer than the budget; other frames cap the estimate,
+	which slowly decays. Trails and HUD are updated less often (``trail_every``, ``hud_every`` frames) when the
+	other tasks take more than ``task_share`` of the budget, and more often again once there's room.
+	"""
+
+	def __init__(self, budget_s, task_share=0.3, max_substeps=16, max_backlog_s=1.0, max_interval=16, adapt_every=30,
+				report_s=5.0):
+		self.budget_s = budget_s  # target frame time
+		self.task_share = task_share
+		self.max_substeps = max_substeps
+		self.max_backlog_s = max_backlog_s
+		self.report_s = report_s
+		self.max_interval = max_interval
+		self.adapt_every = adapt_every
+
+		self.step_cost = None  # seconds per physics step (moving average)
+		self.task_time = 0.0  # seconds per frame spent in the app's tasks apart from physics (moving average)
+		self.render_time = 0.0  # seconds per frame spent outside of the app's tasks (estimate)
+
+		self.substeps = 0
+		self.trail_every = 1
+		self.hud_every = 1
+
+		self.backlog = 0.0  # virtual seconds that are due but not simulated yet
+		self.dropped = 0.0  # virtual seconds given up for good
+		self._drops = deque()  # (wall-clock time, virtual seconds) of the recent losses
+
+		self.frame = 0
+		self._frame_start = 0.0
+		self._frame_physics = 0.0  # physics time of the current frame
+		self._last_tasks = None  # time spent in all tasks during the previous frame
+
+	def reset(self):
+		"""Forgets the backlog and the losses, e.g. when the simulation is paused"""
+
+		self.backlog = 0.0
+		self.dropped = 0.0
+		self._drops.clear()
+		self.substeps = 0
+
+	def plan(self, real_dt, speed, max_step):
+		"""
+		Returns the number of physics steps and their length for this frame
+
+		:param real_dt: wall-clock time of the last frame in s
+		:param speed: simulation speed (virtual seconds per real second)
+		:param max_step: longest allowed step in virtual seconds
+		"""
+		if self._last_tasks is not None:
+			outside = max(real_dt - self._last_tasks, 0.0)
+			if real_dt > self.budget_s:
+				# the frame didn't wait for the next one, all of it was work
+				self.render_time = 0.8 * self.render_time + 0.2 * outside
+			else:
+				# slowly forget the estimate, so physics gets the time back once rendering gets cheaper
+				self.render_time = min(0.99 * self.render_time, outside)
+
+		target = real_dt * speed + self.backlog
+		if target <= 0:
+			self.substeps = 0
+			return 0, 0.0
+
+		if self.step_cost is None:
+			affordable = 1  # nothing measured yet
+		else:
+			available = self.budget_s - self.task_time - self.render_time
+			affordable = int(available / max(self.step_cost, 1e-9))
+		affordable = max(1, min(self.max_substeps, affordable))
+
+		if ceil(target / max_step) <= affordable:
+			self.backlog = 0.0
+			dt = target / affordable
+		else:
+			# can't keep up, simulate as much as possible and carry the rest over
+			dt = max_step
+			self.backlog = target - affordable * dt
+			limit = self.max_backlog_s * speed
+			if self.backlog > limit:
+				self.dropped += self.backlog - limit
+				self._drops.append((time.perf_counter(), self.backlog - limit))
+				self.backlog = limit
+
+		self.substeps = affordable
+		return affordable, dt
+
+	# virtual seconds dropped within the last report_s seconds of wall-clock time
+	def recently_dropped(self):
+		while self._drops and time.perf_counter() - self._drops[0][0] > self.report_s:
+			self._drops.popleft()
+		return sum(lost for _, lost in self._drops)
+
+	def physics_done(self, seconds, steps):
+		self._frame_physics += seconds
+		if steps:
+			cost = seconds / steps
+			self.step_cost = cost if self.step_cost is None else 0.8 * self.step_cost + 0.2 * cost
+
+	def frame_started(self):
+		self.frame += 1
+		self._frame_start = time.perf_counter()
+		self._frame_physics = 0.0
+
+	def frame_finished(self):
+		self._last_tasks = time.perf_counter() - self._frame_start
+		self.task_time = 0.9 * self.task_time + 0.1 * (self._last_tasks - self._frame_physics)
+
+		if self.frame % self.adapt_every:
+			return
+
+		limit = self.budget_s * self.task_share
+		if self.task_time > limit:
+			self.trail_every = min(2 * self.trail_every, self.max_interval)
+			self.hud_every = min(2 * self.hud_every, self.max_interval)
+		elif self.task_time < 0.5 * limit:
+			self.trail_every = max(self.trail_every // 2, 1)
+			self.hud_every = max(self.hud_every // 2, 1)
+
+	# whether something that runs every N frames is due this frame
+	def due(self, every):
+		return self.frame % every == 0
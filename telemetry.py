@@ -0,0 +1,195 @@
+import asyncio
+import json
+import struct
+import threading
+from collections import deque
+
+import numpy as np
+
+# every frame starts with: magic, frame type, payload length
+FRAME_HEADER = struct.Struct("<4sBI")
+FRAME_MAGIC = b"ODTF"
+FRAME_META = 0  # JSON payload: body names and array dtype, sent on connect and whenever the body set changes
+FRAME_STATE = 1  # binary payload: STATE_HEADER followed by positions (m) and velocities (m/s), each (n, 3)
+
+# sequence number, virtual time in s, number of bodies
+STATE_HEADER = struct.Struct("<QdI")
+
+
+def encode_meta(names, dtype):
+	payload = json.dumps({"names": list(names), "dtype": np.dtype(dtype).str}).encode()
+	return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_META, len(payload)) + payload
+
+
+def encode_state(seq, t, pos_m, vel, dtype):
+	n = len(pos_m)
+	payload = (STATE_HEADER.pack(seq, t, n)
+			+ np.ascontiguousarray(pos_m, dtype=dtype).tobytes()
+			+ np.ascontiguousarray(vel, dtype=dtype).tobytes())
+	return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_STATE, len(payload)) + payload
+
+
+def decode_meta(payload):
+	meta = json.loads(payload)
+	return meta["names"], np.dtype(meta["dtype"])
+
+
+def decode_state(payload, dtype):
+	"""Returns ``(seq, t, pos_m, vel)`` of a state frame payload"""
+
+	seq, t, n = STATE_HEADER.unpack_from(payload)
+	arr = np.frombuffer(payload, dtype=dtype, offset=STATE_HEADER.size, count=6 * n)
+	return seq, t, arr[:3 * n].reshape(n, 3), arr[3 * n:].reshape(n, 3)
+
+
+async def read_frame(reader: asyncio.StreamReader):
+	"""Reads one frame from a stream, returns ``(frame_type, payload)``"""
+
+	magic, frame_type, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+	if magic != FRAME_MAGIC:
+		raise ValueError("not an Orbital Dynamics telemetry stream")
+	return frame_type, await reader.readexactly(length)
+
+
+class Subscriber:
+	__slots__ = ("writer", "frames", "meta", "ready", "sent", "dropped")
+
+	def __init__(self, writer, queue_len, meta):
+		self.writer = writer
+		self.frames = deque(maxlen=queue_len)  # oldest frames fall out when the client can't keep up
+		self.meta = meta  # meta frame that has to go out before the next state frame
+		self.ready = asyncio.Event()
+		self.sent = 0
+		self.dropped = 0
+
+
+class TelemetryServer:
+	"""
+	Streams the simulation state to any number of TCP subscribers
+
+	The server runs its own asyncio loop in a background thread. ``publish`` only encodes the frame and hands it
+	over to that loop, so it never waits on the network. Every subscriber has a short queue; if a client can't
+	keep up its oldest frames are dropped instead of stalling the simulation or the other clients.
+	"""
+
+	def __init__(self, host="127.0.0.1", port=47800, every=1, queue_len=4, dtype=np.float32):
+		self.host = host
+		self.port = port
+		self.every = max(1, every)  # publish every N simulation updates (see step)
+		self.queue_len = queue_len
+		self.dtype = np.dtype(dtype)
+
+		self.subscribers = set()
+		self.published = 0
+
+		self._updates = 0
+		self._version = None
+		self._meta = None
+
+		self._loop = None
+		self._server = None
+		self._thread = None
+		self._started = threading.Event()
+		self._error = None  # exception raised while starting the server
+		self._closing = False
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name="TelemetryServer", daemon=True)
+		self._thread.start()
+		self._started.wait()
+		if self._error is not None:
+			self._thread.join()
+			self._loop = None
+			raise self._error
+		print(f"Telemetry server listening on {self.host}:{self.port}")
+
+	def stop(self):
+		if self._loop is None:
+			return
+		self._loop.call_soon_threadsafe(self._loop.stop)
+		self._thread.join()
+		self._loop = None
+
+	# has to be called after every simulation update (once per frame), returns True if a frame should be published now
+	def step(self):
+		self._updates += 1
+		if self._updates < self.every:
+			return False
+		self._updates = 0
+		return self._loop is not None and bool(self.subscribers)  # nobody listening, skip gathering the state
+
+	def publish(self, t, names, version, pos_m, vel):
+		"""
+		Sends the state to all subscribers
+
+		:param t: virtual time in s
+		:param names: sequence of body names matching the rows of the state arrays
+		:param version: number that changes whenever ``names`` changes, the names are only sent again then
+		:param pos_m: (n, 3) array of positions in meters
+		:param vel: (n, 3) array of velocities in m/s
+		"""
+		meta = None
+		if version != self._version:
+			self._version = version
+			meta = self._meta = encode_meta(names, self.dtype)
+
+		frame = encode_state(self.published, t, pos_m, vel, self.dtype)
+		self.published += 1
+		self._loop.call_soon_threadsafe(self._broadcast, frame, meta)
+
+	def _run(self):
+		self._loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self._loop)
+		try:
+			self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+		except Exception as e:  # e.g. port already in use, handed over to start()
+			self._error = e
+			self._loop.close()
+			return
+		finally:
+			self._started.set()
+		try:
+			self._loop.run_forever()
+		finally:
+			self._server.close()
+
+			# disconnect the clients and let their coroutines return (even if blocked on a slow socket)
+			self._closing = True
+			for sub in self.subscribers:
+				sub.writer.transport.abort()
+				sub.ready.set()
+			tasks = asyncio.all_tasks(self._loop)
+			if tasks:
+				self._loop.run_until_complete(asyncio.wait(tasks, timeout=1))
+			self._loop.close()
+
+	def _broadcast(self, frame, meta):
+		for sub in self.subscribers:
+			if meta is not None:
+				# the body set changed, queued frames use the old layout
+				sub.frames.clear()
+				sub.meta = meta
+			elif len(sub.frames) == sub.frames.maxlen:
+				sub.dropped += 1
+			sub.frames.append(frame)
+			sub.ready.set()
+
+	async def _serve(self, reader, writer):
+		sub = Subscriber(writer, self.queue_len, self._meta)
+		self.subscribers.add(sub)
+		try:
+			while not self._closing:
+				await sub.ready.wait()
+				sub.ready.clear()
+				while sub.frames and not self._closing:
+					if sub.meta is not None:
+						writer.write(sub.meta)
+						sub.meta = None
+					writer.write(sub.frames.popleft())
+					sub.sent += 1
+					await writer.drain()  # only this client's coroutine waits on a slow socket
+		except ConnectionError:
+			pass  # client went away
+		finally:
+			self.subscribers.discard(sub)
+			writer.close()
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from telemetry import TelemetryServer
+from telemetry_client import subscribe
+
+
+# measures how fast frames can be published and how many of them reach fast and slow subscribers
+def run(n_bodies, n_clients, n_slow, duration, port):
+	server = TelemetryServer(port=port)
+	server.start()
+
+	stats = [{"received": 0, "bytes": 0, "slow": i < n_slow} for i in range(n_clients)]
+	stop = threading.Event()
+
+	async def client(stat):
+		async for names, seq, t, pos_m, vel in subscribe("127.0.0.1", port):
+			stat["received"] += 1
+			stat["bytes"] += pos_m.nbytes + vel.nbytes
+			if stat["slow"]:
+				await asyncio.sleep(0.05)  # simulates a lagging dashboard
+			if stop.is_set():
+				break
+
+	async def clients():
+		await asyncio.gather(*(client(stat) for stat in stats))
+
+	client_thread = threading.Thread(target=asyncio.run, args=(clients(),), daemon=True)
+	client_thread.start()
+	while len(server.subscribers) < n_clients:
+		time.sleep(0.01)
+
+	names = tuple(f"body{i}" for i in range(n_bodies))
+	pos_m = np.random.default_rng(0).normal(0, 1e11, (n_bodies, 3))
+	vel = np.random.default_rng(1).normal(0, 3e4, (n_bodies, 3))
+
+	# the publisher stands in for calc_forces: it must never be slowed down by the clients
+	publish_times = []
+	start = time.perf_counter()
+	while time.perf_counter() - start < duration:
+		t0 = time.perf_counter()
+		server.publish(t0 - start, names, 0, pos_m, vel)
+		publish_times.append(time.perf_counter() - t0)
+	elapsed = time.perf_counter() - start
+
+	stop.set()
+	time.sleep(0.2)
+	server.stop()
+
+	publish_times = np.array(publish_times)
+	frame_mb = (pos_m.nbytes + vel.nbytes) * server.dtype.itemsize / 8 / 1e6
+	print(f"{n_bodies} bodies, {frame_mb:.3f} MB/frame, {n_clients} clients ({n_slow} slow)")
+	print(f"published {server.published} frames in {elapsed:.2f} s ({server.published / elapsed:.0f} frames/s)")
+	print(f"publish() latency: median {np.median(publish_times) * 1e6:.0f} us, "
+		f"p99 {np.percentile(publish_times, 99) * 1e6:.0f} us, max {publish_times.max() * 1e6:.0f} us")
+	for i, stat in enumerate(stats):
+		print(f"\tclient {i}{' (slow)' if stat['slow'] else ''}: {stat['received']} frames "
+			f"({stat['received'] / elapsed:.0f} frames/s, {stat['bytes'] / elapsed / 1e6:.1f} MB/s)")
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Telemetry server throughput benchmark")
+	parser.add_argument("--bodies", type=int, default=1000)
+	parser.add_argument("--clients", type=int, default=4)
+	parser.add_argument("--slow", type=int, default=1, help="how many of the clients are deliberately slow")
+	parser.add_argument("--duration", type=float, default=5)
+	parser.add_argument("--port", type=int, default=47801)
+	args = parser.parse_args()
+
+	run(args.bodies, args.clients, args.slow, args.duration, args.port)
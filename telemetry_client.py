@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import time
+
+from telemetry import FRAME_META, FRAME_STATE, read_frame, decode_meta, decode_state
+
+
+async def subscribe(host, port):
+	"""
+	Connects to a telemetry server and yields ``(names, seq, t, pos_m, vel)`` for every state frame
+
+	Ends when the server closes the connection (e.g. because the simulation was closed).
+	"""
+
+	reader, writer = await asyncio.open_connection(host, port)
+	names, dtype = None, None
+	try:
+		while True:
+			try:
+				frame_type, payload = await read_frame(reader)
+			except (asyncio.IncompleteReadError, ConnectionError):
+				return  # server went away
+			if frame_type == FRAME_META:
+				names, dtype = decode_meta(payload)
+			elif frame_type == FRAME_STATE and dtype is not None:
+				yield (names, *decode_state(payload, dtype))
+	finally:
+		writer.close()
+
+
+async def main(host, port, count):
+	received = 0
+	last_seq = None
+	missed = 0
+	start = time.perf_counter()
+
+	async for names, seq, t, pos_m, vel in subscribe(host, port):
+		if last_seq is not None:
+			missed += seq - last_seq - 1  # frames the server dropped because we were too slow
+		last_seq = seq
+		received += 1
+
+		print(f"#{seq}  t = {t:.0f} s  {len(names)} bodies  {names[0]} @ ({pos_m[0][0]:.4g}, {pos_m[0][1]:.4g}, "
+			f"{pos_m[0][2]:.4g}) m")
+
+		if count and received >= count:
+			break
+
+	elapsed = time.perf_counter() - start
+	print(f"\n{received} frames in {elapsed:.2f} s ({received / elapsed:.1f} frames/s), {missed} dropped by server")
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Prints the state frames streamed by a running simulation")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=47800)
+	parser.add_argument("--count", type=int, default=0, help="stop after this many frames (0 = never)")
+	args = parser.parse_args()
+
+	try:
+		asyncio.run(main(args.host, args.port, args.count))
+	except KeyboardInterrupt:
+		pass